@@ -1,40 +1,101 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import imageio_ffmpeg
 import librosa
+import numba
 import numpy as np
-import matplotlib.pyplot as plt
-import moviepy as mp
-import moviepy.video.fx as vfx
-from mutagen import File
+import soundfile as sf
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mutagen.easyid3 import EasyID3
 from mutagen.id3 import ID3NoHeaderError
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 
+WAVEFORM_POINTS = 2000
+VIDEO_FPS = 24
+HOP_LENGTH = 512
+# Audio formats that can be muxed into MP4 as-is
+COPY_AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac')
+
+_FIG = None
+_AX = None
+_FIG_LOCK = threading.Lock()
+
+
 def generate_ai_visuals(theme):
     width, height = 1920, 1080
-    image = Image.new("RGB", (width, height), theme)
-    draw = ImageDraw.Draw(image)
-    for i in range(height):
-        color = (
-            int(theme[0] * (i / height)),
-            int(theme[1] * (i / height)),
-            int(theme[2] * (i / height))
-        )
-        draw.line([(0, i), (width, i)], fill=color)
-    return image
+    # Integer math: theme * i / height truncated, without float rounding; uint32 since 255 * 1079 overflows uint16
+    i = np.arange(height, dtype=np.uint32)[:, None]
+    rgb = (np.asarray(theme, dtype=np.uint32)[None, :] * i // height).astype(np.uint8)
+    arr = np.broadcast_to(rgb[:, None, :], (height, width, 3)).copy()
+    return arr
+
+
+def render_text(text, fontsize=24):
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", fontsize)
+    except OSError:
+        font = ImageFont.load_default()
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox((0, 0), text, font=font, align='center')
+    band = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    ImageDraw.Draw(band).multiline_text((-left, -top), text, font=font, fill='white', align='center')
+    return band
+
+
+def render_waveform(time, env):
+    global _FIG, _AX
+    # The cached figure is shared by every render, so build and read it under one lock
+    with _FIG_LOCK:
+        if _FIG is None:
+            _FIG = Figure(figsize=(10, 4))
+            FigureCanvasAgg(_FIG)
+            _AX = _FIG.add_subplot()
+        _AX.cla()
+        _AX.plot(time, env, color='cyan')
+        _AX.set_title('Waveform')
+        _AX.set_xlabel('Time (s)')
+        _AX.set_ylabel('Amplitude')
+        _FIG.tight_layout()
+        _FIG.canvas.draw()
+        return np.array(_FIG.canvas.buffer_rgba())[..., :3]
+
+
+def compose_background(ai_array, waveform_array, text):
+    # Everything but the beat effects is static, so flatten it into a single frame up front
+    background = Image.fromarray(ai_array)
+    waveform = Image.fromarray(waveform_array)
+    background.paste(waveform, ((background.width - waveform.width) // 2, (background.height - waveform.height) // 2))
+    text_band = render_text(text)
+    background.paste(text_band, ((background.width - text_band.width) // 2, background.height - text_band.height), text_band)
+    return np.asarray(background)
+
+
+def load_audio(audio_path):
+    try:
+        y, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+    except RuntimeError:
+        # libsndfile can't decode this format; fall back to librosa at the native rate
+        return librosa.load(audio_path, sr=None, mono=True)
+    if y.ndim > 1:
+        y = y.mean(axis=1)
+    return y, sr
 
 
 def extract_metadata(audio_path):
     metadata = {"title": "Unknown Title", "artist": "Unknown Artist", "album": "Unknown Album"}
+    if not audio_path.lower().endswith('.mp3'):
+        return metadata
     try:
-        audio = File(audio_path)
-        if audio is None:
-            return metadata
-        tags = audio.tags
-        if tags:
-            metadata['title'] = tags.get('TIT2', metadata['title']).text[0] if 'TIT2' in tags else metadata['title']
-            metadata['artist'] = tags.get('TPE1', metadata['artist']).text[0] if 'TPE1' in tags else metadata['artist']
-            metadata['album'] = tags.get('TALB', metadata['album']).text[0] if 'TALB' in tags else metadata['album']
+        tags = EasyID3(audio_path)
+        for key in metadata:
+            if key in tags:
+                metadata[key] = tags[key][0]
     except ID3NoHeaderError:
         pass
     except Exception:
@@ -42,70 +103,107 @@ def extract_metadata(audio_path):
     return metadata
 
 
-def brighten(clip, factor):
-    return clip.fl_image(lambda frame: np.clip(frame * factor, 0, 255).astype(np.uint8))
+@numba.njit(nogil=True, cache=True, fastmath=True)
+def brighten_zoom(src, dst, factor, rows, cols):
+    # Fused brighten + centre zoom: one pass over the frame, no float temporaries.
+    # Runs without the GIL so write_video can render several frames concurrently.
+    for y in range(dst.shape[0]):
+        sy = rows[y]
+        for x in range(dst.shape[1]):
+            sx = cols[x]
+            for c in range(3):
+                v = src[sy, sx, c] * factor
+                dst[y, x, c] = 255 if v > 255 else np.uint8(v)
 
 
-def apply_beat_effects(clip, beat_times):
-    clips = []
-    last_t = 0
-    for bt in beat_times:
-        if bt > last_t:
-            clips.append(clip.subclip(last_t, bt))
-        effect_clip = (
-            clip.subclip(bt, min(bt + 0.1, clip.duration))
-            .fx(brighten, 1.5)
-            .fx(vfx.crop, x_center=clip.w / 2, y_center=clip.h / 2, width=clip.w * 0.9, height=clip.h * 0.9)
-        )
-        clips.append(effect_clip)
-        last_t = bt + 0.1
-    if last_t < clip.duration:
-        clips.append(clip.subclip(last_t))
-    return mp.concatenate_videoclips(clips)
+def zoom_indices(h, w, scale):
+    # Source rows/cols for cropping the central `scale` portion and stretching it back to (h, w)
+    rows = ((np.arange(h) - h / 2) * scale + h / 2).astype(np.intp)
+    cols = ((np.arange(w) - w / 2) * scale + w / 2).astype(np.intp)
+    return rows, cols
 
 
-def generate_waveform_video_with_effects(audio_path, output_path, theme=(0, 0, 255)):
-    y, sr = librosa.load(audio_path)
-    amplitude_envelope = np.abs(y)
-    time = np.linspace(0, len(y) / sr, len(y))
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
-
-    # Save waveform image
-    plt.figure(figsize=(10, 4))
-    plt.plot(time, amplitude_envelope, color='cyan')
-    plt.title('Waveform')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Amplitude')
-    plt.tight_layout()
-    waveform_image_path = 'waveform.png'
-    plt.savefig(waveform_image_path)
-    plt.close()
+class BeatEffect:
+    def __init__(self, beat_times, size, effect_duration=0.1, factor=1.5, zoom=0.9):
+        w, h = size
+        self.beat_times = np.sort(np.asarray(beat_times, dtype=np.float64))
+        self.effect_duration = effect_duration
+        self.factor = factor
+        self.rows, self.cols = zoom_indices(h, w, zoom)
 
-    # Generate AI visuals
-    ai_visuals = generate_ai_visuals(theme)
-    ai_visuals_path = 'ai_visuals.png'
-    ai_visuals.save(ai_visuals_path)
+    def is_beat(self, t):
+        i = np.searchsorted(self.beat_times, t, side='right') - 1
+        return i >= 0 and t - self.beat_times[i] < self.effect_duration
 
-    # Create video clips
-    duration = librosa.get_duration(y=y, sr=sr)
-    ai_clip = mp.ImageClip(ai_visuals_path).set_duration(duration)
-    waveform_clip = mp.ImageClip(waveform_image_path).set_duration(duration)
-    combined_clip = mp.CompositeVideoClip([ai_clip, waveform_clip.set_position(("center", "center"))])
-    audio_clip = mp.AudioFileClip(audio_path)
-    video = combined_clip.set_audio(audio_clip)
+    def render(self, frame, t, out):
+        if not self.is_beat(t):
+            return frame
+        brighten_zoom(frame, out, self.factor, self.rows, self.cols)
+        return out
+
+
+def write_video(output_path, background, duration, beat_effect, audio_path):
+    h, w = background.shape[:2]
+    writer = imageio_ffmpeg.write_frames(
+        output_path,
+        (w, h),
+        fps=VIDEO_FPS,
+        codec='libx264',
+        quality=None,
+        macro_block_size=1,  # 1080 is not a multiple of 16; keep the exact frame size
+        output_params=['-preset', 'veryfast', '-crf', '23', '-tune', 'stillimage', '-movflags', '+faststart'],
+        audio_path=audio_path,
+        audio_codec='copy' if audio_path.lower().endswith(COPY_AUDIO_EXTENSIONS) else 'aac',
+    )
+    workers = os.cpu_count() or 4
+    # Frame fi renders into buffers[fi % len(buffers)]; at most len(buffers) frames are in
+    # flight and they are sent in order, so a buffer is always free again when reused
+    buffers = [np.empty_like(background) for _ in range(2 * workers)]
+    pending = deque()
+    writer.send(None)  # start the ffmpeg process
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for fi in range(int(np.ceil(duration * VIDEO_FPS))):
+                if len(pending) == len(buffers):
+                    writer.send(pending.popleft().result())
+                out = buffers[fi % len(buffers)]
+                pending.append(pool.submit(beat_effect.render, background, fi / VIDEO_FPS, out))
+            while pending:
+                writer.send(pending.popleft().result())
+    finally:
+        writer.close()
 
-    # Apply beat-synced effects
-    video_with_effects = apply_beat_effects(video, beat_times)
 
-    # Add metadata overlay
+def generate_waveform_video_with_effects(audio_path, output_path, theme=(0, 0, 255)):
     metadata = extract_metadata(audio_path)
+    y, sr = load_audio(audio_path)
+    duration = librosa.get_duration(y=y, sr=sr)
+    # One onset envelope at the native rate; kept around for tempo/tempogram analysis
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH, aggregate=np.median)
+    tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+    beat_times = beat_frames.astype(np.float64) * (HOP_LENGTH / sr)
+
+    # Downsample to one peak per block; the plot is only ~1000 px wide
+    n_out = min(WAVEFORM_POINTS, len(y))
+    y_blocks = y[:n_out * (len(y) // n_out)].reshape(n_out, -1)
+    env = np.maximum(y_blocks.max(axis=1), -y_blocks.min(axis=1))
+
+    # Render waveform image
+    time = np.linspace(0, duration, n_out, dtype=np.float32)
+    waveform_array = render_waveform(time, env)
+
+    # Generate AI visuals
+    ai_array = generate_ai_visuals(theme)
+
+    # Metadata overlay
     txt = f"Title: {metadata['title']}\nArtist: {metadata['artist']}\nAlbum: {metadata['album']}"
-    txt_clip = mp.TextClip(txt, fontsize=24, color='white').set_position(('center', 'bottom')).set_duration(duration)
-    final_video = mp.CompositeVideoClip([video_with_effects, txt_clip])
 
-    # Export
-    final_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+    # Pre-composited static frame
+    background = compose_background(ai_array, waveform_array, txt)
+
+    # Export with beat-synced effects, muxing the original audio
+    beat_effect = BeatEffect(beat_times, (background.shape[1], background.shape[0]))
+    write_video(output_path, background, duration, beat_effect, audio_path)
 
 
 def select_audio_file():
@@ -128,8 +226,24 @@ def generate_video():
     if not audio_path or not output_path:
         messagebox.showerror("Error", "Please select both audio file and output file.")
         return
-    generate_waveform_video_with_effects(audio_path, output_path)
-    messagebox.showinfo("Success", f"Video saved to {output_path}")
+
+    # Render off the Tk thread so the window keeps repainting; report back via root.after.
+    # The button stays disabled until the job finishes so only one render runs at a time.
+    def _finish(show, title, message):
+        generate_button.config(state=tk.NORMAL)
+        show(title, message)
+
+    def _worker():
+        try:
+            generate_waveform_video_with_effects(audio_path, output_path)
+        except Exception as e:
+            error = f"Video generation failed: {e}"
+            root.after(0, lambda: _finish(messagebox.showerror, "Error", error))
+            return
+        root.after(0, lambda: _finish(messagebox.showinfo, "Success", f"Video saved to {output_path}"))
+
+    generate_button.config(state=tk.DISABLED)
+    threading.Thread(target=_worker, daemon=True).start()
 
 
 # Create the GUI
@@ -146,6 +260,7 @@ output_file_entry = tk.Entry(root, width=50)
 output_file_entry.grid(row=1, column=1, padx=10, pady=10)
 tk.Button(root, text="Browse", command=select_output_file).grid(row=1, column=2, padx=10, pady=10)
 
-tk.Button(root, text="Generate Video", command=generate_video).grid(row=2, column=0, columnspan=3, padx=10, pady=20)
+generate_button = tk.Button(root, text="Generate Video", command=generate_video)
+generate_button.grid(row=2, column=0, columnspan=3, padx=10, pady=20)
 
 root.mainloop()